@@ -1,30 +1,43 @@
 # main.py
 
 import datetime
+import gzip
 import re
+from collections import OrderedDict
+from contextlib import AsyncExitStack
 import uuid
 import asyncio
 import logging
-import traceback
 import os
-
-print(f"=== APP STARTING ===")
-print(f"PORT: {os.getenv('PORT')}")
-print(f"RAILWAY_PUBLIC_DOMAIN: {os.getenv('RAILWAY_PUBLIC_DOMAIN')}")
-print(f"RAILWAY_ENVIRONMENT: {os.getenv('RAILWAY_ENVIRONMENT')}")
-print(f"===================")
+import sys
+import time
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 
+import httpx
+from cachetools import TTLCache
 from pydantic import BaseModel
+from selectolax.lexbor import LexborHTMLParser
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
 
+# libuv-backed loop for the Playwright/CDP websocket traffic, when available
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
+
+# Determine if we're in production based on environment variable
+IS_PRODUCTION = os.getenv("ENVIRONMENT", "development") == "production"
 
 logging.basicConfig(
     format="%(asctime)s %(levelname)s %(message)s",
-    level=logging.DEBUG
+    level=logging.INFO if IS_PRODUCTION else logging.DEBUG
 )
+# Playwright's driver chatter drowns out our own logs even in development
+logging.getLogger("playwright").setLevel(logging.WARNING)
 
 app = FastAPI()
 
@@ -36,7 +49,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-_sessions: dict[str, dict] = {}  # token → {"pw","browser","context","created"}
+_sessions: OrderedDict[str, dict] = OrderedDict()  # token → {"pooled","context","http","stack","lock","created"}, least recently used first
+
+SESSION_TTL            = int(os.getenv("SESSION_TTL", str(30 * 60)))  # seconds
+MAX_SESSIONS           = int(os.getenv("MAX_SESSIONS", "100"))
+SESSION_SWEEP_INTERVAL = 60  # seconds
+
+# BizPortal data changes daily at most, so identical searches share a result
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "300"))  # seconds
+_search_cache: TTLCache = TTLCache(maxsize=10_000, ttl=SEARCH_CACHE_TTL)
+_search_inflight: dict[str, asyncio.Task] = {}  # query key → the search serving concurrent misses
+
+# Long-lived Chromium processes shared by all sessions: each /connect gets its
+# own incognito context (cookies/auth are per context) on the least loaded one
+BROWSER_POOL_SIZE  = int(os.getenv("BROWSER_POOL_SIZE", "1"))
+BROWSER_MAX_USES   = int(os.getenv("BROWSER_MAX_USES", "200"))  # contexts before retiring
+BROWSER_MAX_AGE_MS = int(os.getenv("BROWSER_MAX_AGE_MS", str(30 * 60 * 1000)))
+BROWSER_HEALTH_CHECK_INTERVAL = 30  # seconds
+
+# Headless in production, headed in development unless there's no display
+HEADLESS = IS_PRODUCTION or (sys.platform.startswith("linux") and not os.getenv("DISPLAY"))
+
+# Applied in every environment: trims Chromium's helper processes and keeps
+# timers in unfocused pages (BizPortal's AJAX postbacks use them) unthrottled
+CHROMIUM_ARGS = [
+    "--no-sandbox",
+    "--disable-setuid-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-extensions",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--disable-background-networking",
+    "--disable-background-timer-throttling",
+    "--disable-renderer-backgrounding",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-ipc-flooding-protection",
+]
+
+# Only DOM text and img src strings are scraped, so skip fetching these
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media", "stylesheet"}
+
+_pw = None
+_browsers: list[dict] = []  # {"browser","uses","active","launched"}
+_browsers_lock = asyncio.Lock()  # serializes launches so a burst doesn't start several
+_health_task: asyncio.Task | None = None
+_sweep_task: asyncio.Task | None = None
+_evictions: set[asyncio.Task] = set()  # background teardowns, referenced until done
 
 class ConnectRequest(BaseModel):
     username: str  # SA ID number or CIPC customer code
@@ -48,14 +107,591 @@ class SearchRequest(BaseModel):
     query: str  # enterprise name or Directory ID
 
 
+async def _launch_browser() -> dict:
+    browser = await _pw.chromium.launch(
+        headless=HEADLESS,
+        args=CHROMIUM_ARGS,
+        ignore_default_args=["--enable-automation"],
+    )
+    return {"browser": browser, "uses": 0, "active": 0, "launched": time.monotonic()}
+
+
+def _browser_expired(pooled: dict) -> bool:
+    age_ms = (time.monotonic() - pooled["launched"]) * 1000
+    return (
+        pooled["uses"] >= BROWSER_MAX_USES
+        or age_ms >= BROWSER_MAX_AGE_MS
+        or not pooled["browser"].is_connected()
+    )
+
+
+async def _block_heavy_resources(route):
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def _new_context(browser):
+    context = await browser.new_context()
+    await context.route("**/*", _block_heavy_resources)
+    return context
+
+
+async def _fill_browser_pool() -> list[dict]:
+    """Launch browsers until BROWSER_POOL_SIZE are accepting new contexts."""
+    global _pw
+    async with _browsers_lock:
+        if _pw is None:
+            _pw = await async_playwright().start()
+        live = [b for b in _browsers if not _browser_expired(b)]
+        results = await asyncio.gather(*(
+            _launch_browser() for _ in range(BROWSER_POOL_SIZE - len(live))
+        ), return_exceptions=True)
+        launched = [r for r in results if not isinstance(r, BaseException)]
+        for error in results:
+            if isinstance(error, BaseException):
+                logging.error("Could not launch pooled browser: %s", error)
+        _browsers.extend(launched)
+        if not live and not launched:
+            raise RuntimeError("No browser available")
+        return live + launched
+
+
+async def _acquire_browser() -> dict:
+    """Pick the least loaded shared browser to open a session context on."""
+    live = [b for b in _browsers if not _browser_expired(b)]
+    if len(live) < BROWSER_POOL_SIZE:
+        live = await _fill_browser_pool()
+    pooled = min(live, key=lambda b: b["active"])
+    pooled["uses"] += 1
+    pooled["active"] += 1
+    return pooled
+
+
+async def _retire_browser(pooled: dict):
+    if pooled in _browsers:
+        _browsers.remove(pooled)
+    try:
+        await pooled["browser"].close()
+    except Exception as e:
+        logging.warning("Error closing recycled browser: %s", e)
+
+
+async def _release_browser(pooled: dict):
+    """Give back a session's share of a browser; close it once worn out and idle."""
+    pooled["active"] -= 1
+    if pooled["active"] == 0 and _browser_expired(pooled):
+        await _retire_browser(pooled)
+
+
+async def _check_browsers():
+    """Drop crashed or retired browsers and top the pool back up."""
+    for pooled in list(_browsers):
+        if not pooled["browser"].is_connected():
+            # its sessions' contexts died with it; drop them so clients
+            # get a 401 and reconnect instead of 500s
+            orphaned = [t for t, s in _sessions.items() if s["pooled"] is pooled]
+            for token in orphaned:
+                try:
+                    await _close_session(token)
+                except Exception as e:
+                    logging.warning("Error closing session of crashed browser: %s", e)
+            await _retire_browser(pooled)
+        elif pooled["active"] == 0 and _browser_expired(pooled):
+            await _retire_browser(pooled)
+        elif len(pooled["browser"].contexts) > pooled["active"]:
+            logging.warning(
+                "Browser holds %s contexts for %s sessions",
+                len(pooled["browser"].contexts), pooled["active"],
+            )
+    await _fill_browser_pool()
+
+
+async def _browser_health_check():
+    while True:
+        await asyncio.sleep(BROWSER_HEALTH_CHECK_INTERVAL)
+        try:
+            await _check_browsers()
+        except Exception as e:
+            logging.error("Browser pool health check failed: %s", e)
+
+
+async def _close_session(token: str):
+    """Drop a session, closing its context and releasing its browser."""
+    session = _sessions.pop(token, None)
+    if session:
+        await _teardown_session(session)
+
+
+async def _teardown_session(session: dict):
+    # let an in-flight /search finish before pulling its context away, then
+    # unwind what /connect opened: HTTP client, context, then the browser
+    async with session["lock"]:
+        await session["stack"].aclose()
+
+
+async def _evict_session(session: dict):
+    try:
+        await _teardown_session(session)
+    except Exception as e:
+        logging.warning("Error evicting session: %s", e)
+
+
+def _evict_lru_sessions():
+    """Unregister sessions beyond MAX_SESSIONS, least recently used first.
+
+    They're torn down in the background so the caller neither waits on
+    nor fails with someone else's teardown.
+    """
+    while len(_sessions) > MAX_SESSIONS:
+        _, session = _sessions.popitem(last=False)
+        task = asyncio.create_task(_evict_session(session))
+        _evictions.add(task)
+        task.add_done_callback(_evictions.discard)
+
+
+async def _close_stale_sessions():
+    now = time.monotonic()
+    stale = [t for t, s in _sessions.items() if now - s["created"] > SESSION_TTL]
+    for token in stale:
+        try:
+            await _close_session(token)
+        except Exception as e:
+            logging.warning("Error expiring session: %s", e)
+
+
+async def _expire_sessions():
+    """Close sessions older than SESSION_TTL so their contexts aren't leaked."""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        await _close_stale_sessions()
+
+
+@app.on_event("startup")
+async def start_browser_pool():
+    global _health_task
+    logging.info(
+        "App starting: PORT=%s RAILWAY_PUBLIC_DOMAIN=%s RAILWAY_ENVIRONMENT=%s",
+        os.getenv("PORT"), os.getenv("RAILWAY_PUBLIC_DOMAIN"), os.getenv("RAILWAY_ENVIRONMENT"),
+    )
+    # Warm-up only: if no browser starts now, /connect and the health check
+    # keep trying instead of the whole app failing to boot
+    try:
+        await _fill_browser_pool()
+    except Exception as e:
+        logging.error("Browser pool warm-up failed: %s", e)
+    _health_task = asyncio.create_task(_browser_health_check())
+
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    global _sweep_task
+    _sweep_task = asyncio.create_task(_expire_sessions())
+
+
+@app.on_event("shutdown")
+async def stop_browser_pool():
+    for task in (_health_task, _sweep_task):
+        if task:
+            task.cancel()
+    # let evicted sessions finish handing their browsers back first
+    await asyncio.gather(*_evictions, return_exceptions=True)
+    # unwind live sessions as /disconnect would, closing their contexts
+    while _sessions:
+        _, session = _sessions.popitem()
+        try:
+            await _teardown_session(session)
+        except Exception as e:
+            logging.warning("Error closing session on shutdown: %s", e)
+    try:
+        while _browsers:
+            pooled = _browsers.pop()
+            try:
+                await pooled["browser"].close()
+            except Exception as e:
+                logging.warning("Error closing browser on shutdown: %s", e)
+    finally:
+        if _pw:
+            await _pw.stop()
+
+
+_STATUS_MAP = {
+    "verify_tick_sml.png":   "IN BUSINESS",
+    "verify_orange_sml.png": "IN DEREGISTRATION PROCESS",
+    "verify_cross_sml.png":  "FINAL DEREGISTRATION",
+}
+
 def _map_status_from_src(src: str) -> str:
-    if "verify_tick_sml.png" in src:
-        return "IN BUSINESS"
-    if "verify_orange_sml.png" in src:
-        return "IN DEREGISTRATION PROCESS"
-    if "verify_cross_sml.png" in src:
-        return "FINAL DEREGISTRATION"
-    return "UNKNOWN"
+    filename = src.split("?", 1)[0].split("#", 1)[0].rsplit("/", 1)[-1]
+    return _STATUS_MAP.get(filename, "UNKNOWN")
+
+
+BIZPROFILE_URL = "https://www.bizportal.gov.za/bizprofile.aspx"
+
+# LinkButtons post back via javascript:__doPostBack('<target>','')
+_POSTBACK_RE = re.compile(r"__doPostBack\('([^']+)'")
+
+# Company Details tab labels, in response order
+COMPANY_FIELDS = (
+    "cntMain_lblEntNo",
+    "cntMain_lblEntName",
+    "cntMain_lblEntType",
+    "cntMain_lblEntStatus",
+    "cntMain_lblNonComply",
+    "cntMain_lblRegDate",
+    "cntMain_lblPhysAddress",
+    "cntMain_lblPostalAddress",
+)
+
+# Ids read from the other results tabs
+DIRECTORS_TABLES      = ("cntMain_gdvDirectorDetails",)
+ANNUAL_RETURNS_TABLES = ("cntMain_gdvARPaid", "cntMain_gdvAROutstanding")
+HISTORY_TABLES        = ("cntMain_gdvEntHist",)
+COMPLIANCE_FIELDS     = ("cntMain_lblIRRegNumber", "cntMain_lblOrgType")
+COMPLIANCE_STYLES     = ("cntMain_pnlInfoRegNotRegistered",)
+OTHER_DETAILS_FIELDS  = ("cntMain_lblTax", "cntMain_lblUIF", "cntMain_lblCF")
+
+# Everything read from a results page
+RESULT_LABELS = COMPANY_FIELDS + COMPLIANCE_FIELDS + OTHER_DETAILS_FIELDS
+RESULT_TABLES = DIRECTORS_TABLES + ANNUAL_RETURNS_TABLES + HISTORY_TABLES
+
+
+def _scrape_tree(tree, labels=(), tables=(), styles=()) -> dict:
+    """Batch-read element text, table rows (header skipped) and inline styles."""
+    def text(el_id):
+        node = tree.css_first(f"#{el_id}")
+        return node.text().strip() if node else None
+
+    def rows(el_id):
+        return [
+            [cell.text().strip() for cell in row.css("td")]
+            for row in tree.css(f"#{el_id} tbody tr")[1:]  # skip header
+        ]
+
+    def style(el_id):
+        node = tree.css_first(f"#{el_id}")
+        return (node.attributes.get("style") or "") if node else None
+
+    return {
+        "labels": {el_id: text(el_id) for el_id in labels},
+        "tables": {el_id: rows(el_id) for el_id in tables},
+        "styles": {el_id: style(el_id) for el_id in styles},
+    }
+
+
+_DATE_RE = re.compile(r"^(\d{4})/(\d{1,2})/(\d{1,2})$")
+
+def _iso_date(s: str) -> str:
+    """YYYY/M/D → YYYY-MM-DD; anything else is returned unchanged."""
+    m = _DATE_RE.match(s)
+    return f"{m[1]}-{int(m[2]):02d}-{int(m[3]):02d}" if m else s
+
+
+def _parse_company_details(raw: dict) -> dict:
+    """Company Details tab."""
+    labels = raw["labels"]
+    company_details = {}
+    company_details["enterpriseNumber"] = labels.get("cntMain_lblEntNo")
+    company_details["enterpriseName"] = labels.get("cntMain_lblEntName")
+    company_details["enterpriseType"] = labels.get("cntMain_lblEntType")
+    company_details["enterpriseStatus"] = labels.get("cntMain_lblEntStatus")
+
+    compliance_text = labels.get("cntMain_lblNonComply")
+    company_details["complianceNotice"] = None if compliance_text == "NONE" else compliance_text
+
+    reg_date_raw = labels.get("cntMain_lblRegDate")
+    company_details["registrationDate"] = _iso_date(reg_date_raw) if reg_date_raw else reg_date_raw
+
+    # Format addresses
+    phys_addr_raw = labels.get("cntMain_lblPhysAddress")
+    company_details["physicalAddress"] = phys_addr_raw.replace("\n", ", ") if phys_addr_raw else None
+
+    postal_addr_raw = labels.get("cntMain_lblPostalAddress")
+    company_details["postalAddress"] = postal_addr_raw.replace("\n", ", ") if postal_addr_raw else None
+    return company_details
+
+
+def _parse_directors(raw: dict) -> list[dict]:
+    """Directors tab."""
+    directors = []
+    for cells in raw["tables"].get("cntMain_gdvDirectorDetails", []):
+        if len(cells) >= 5:
+            directors.append({
+                "idNumber": cells[0],
+                "names": cells[1],
+                "surname": cells[2],
+                "type": cells[3],
+                "status": cells[4]
+            })
+    return directors
+
+
+def _parse_annual_returns(raw: dict) -> dict:
+    """Annual Returns tab: filed and outstanding returns."""
+    annual_returns = {"filedAnnualReturns": [], "outstandingAnnualReturns": []}
+
+    # Filed Annual Returns
+    for cells in raw["tables"].get("cntMain_gdvARPaid", []):
+        if len(cells) >= 3 and "No annual returns" not in cells[0]:
+            year_text = cells[0]
+            annual_returns["filedAnnualReturns"].append({
+                "year": int(year_text) if year_text.isdigit() else year_text,
+                "amountPaid": cells[1],
+                "dateFiled": cells[2]
+            })
+
+    # Outstanding Annual Returns
+    for cells in raw["tables"].get("cntMain_gdvAROutstanding", []):
+        if len(cells) >= 3:
+            year_text = cells[0]
+            annual_returns["outstandingAnnualReturns"].append({
+                "year": int(year_text) if year_text.isdigit() else year_text,
+                "month": cells[1],
+                "nonComplianceDate": cells[2]
+            })
+    return annual_returns
+
+
+def _parse_history(raw: dict) -> list[dict]:
+    """Enterprise History tab."""
+    return [
+        {"date": _iso_date(cells[0]), "details": cells[1]}
+        for cells in raw["tables"].get("cntMain_gdvEntHist", [])
+        if len(cells) >= 2
+    ]
+
+
+def _empty_compliance_information() -> dict:
+    return {
+        "regulatorRegistrationNumber": None,
+        "organisationType": None,
+        "privateOrganisationType": None,
+        "informationOfficerDetails": {
+            "surname": None,
+            "names": None,
+            "designation": None,
+            "appointmentDate": None
+        },
+        "deputyInformationOfficerDetails": {
+            "surname": None,
+            "names": None,
+            "type": None,
+            "designation": None,
+            "appointmentDate": None
+        },
+        "paiaAnnualReporting": {
+            "submissionHistory": [],
+            "latestSubmissionNote": None
+        }
+    }
+
+
+def _parse_compliance_information(raw: dict) -> dict:
+    """Information Regulator Compliance tab."""
+    compliance_information = _empty_compliance_information()
+
+    # Check if the entity is registered
+    not_registered_style = raw["styles"].get("cntMain_pnlInfoRegNotRegistered")
+    if not_registered_style is None or "display: none" in not_registered_style:
+        # Entity is registered, extract the data
+        # Note: The selectors below are hypothetical as they weren't in your HTML
+        # You'll need to update these based on the actual registered entity HTML structure
+
+        if raw["labels"].get("cntMain_lblIRRegNumber") is not None:
+            compliance_information["regulatorRegistrationNumber"] = raw["labels"]["cntMain_lblIRRegNumber"]
+
+        if raw["labels"].get("cntMain_lblOrgType") is not None:
+            compliance_information["organisationType"] = raw["labels"]["cntMain_lblOrgType"]
+
+        # Extract other compliance fields if they exist...
+        # This is a placeholder structure - you'll need the actual selectors
+    return compliance_information
+
+
+def _parse_other_details(raw: dict) -> dict:
+    """Other Details tab: SARS, UIF and Compensation Fund numbers."""
+    other_details = {}
+    other_details["sarsTaxNumber"] = raw["labels"].get("cntMain_lblTax")
+
+    uif_text = raw["labels"].get("cntMain_lblUIF")
+    other_details["uifRegNumber"] = None if uif_text == "NOT AVAILABLE" else uif_text
+
+    cf_text = raw["labels"].get("cntMain_lblCF")
+    other_details["compensationFundRegNum"] = None if cf_text == "NOT AVAILABLE" else cf_text
+    return other_details
+
+
+def _parse_results(tree) -> dict:
+    """Every tab of a parsed results page.
+
+    The tabs are CSS radio tabs, so their content is already in the markup;
+    nothing needs clicking before it is read.
+    """
+    raw = _scrape_tree(tree, labels=RESULT_LABELS, tables=RESULT_TABLES, styles=COMPLIANCE_STYLES)
+    return {
+        "company_details": _parse_company_details(raw),
+        "directors": _parse_directors(raw),
+        "annual_returns": _parse_annual_returns(raw),
+        "history": _parse_history(raw),
+        "compliance_information": _parse_compliance_information(raw),
+        "other_details": _parse_other_details(raw)
+    }
+
+
+def _form_fields(tree) -> dict:
+    """ASP.NET hidden state (__VIEWSTATE, __EVENTVALIDATION, ...) from a page."""
+    return {
+        node.attributes["name"]: node.attributes.get("value") or ""
+        for node in tree.css("input[type=hidden]")
+        if node.attributes.get("name")
+    }
+
+
+def _search_form(tree, query: str) -> dict | None:
+    """Postback fields for an Enterprise No. search; None if the form is missing."""
+    dropdown = tree.css_first("#cntMain_drpSearchOptions")
+    search_input = tree.css_first("#cntMain_txtSearchCIPC")
+    search_button = tree.css_first("#cntMain_btnSearch")
+    if not (dropdown and search_input and search_button):
+        return None  # bounced to login, or the form changed
+
+    form = _form_fields(tree)
+    form[dropdown.attributes["name"]] = "EntNo"
+    form[search_input.attributes["name"]] = query
+    if search_button.tag == "input":
+        form[search_button.attributes["name"]] = search_button.attributes.get("value") or ""
+    else:
+        postback = _POSTBACK_RE.search(search_button.attributes.get("href") or "")
+        if not postback:
+            return None
+        form["__EVENTTARGET"] = postback[1]
+    return form
+
+
+def _search_failed(error_text: str) -> dict:
+    return {
+        "success": False,
+        "error": error_text,
+        "message": f"Search failed: {error_text}"
+    }
+
+
+def _no_results(query: str) -> dict:
+    return {
+        "success": True,
+        "data": [],
+        "message": f"No results found for enterprise number: {query}"
+    }
+
+
+def _search_reply(tree, query: str) -> dict | None:
+    """The /search reply for a parsed search postback response; None if it's unrecognised.
+
+    Only an empty results panel counts as "no results": the search box alone
+    is also what a postback that never ran the search comes back with.
+    """
+    if tree.css_first("#cntMain_lblEntNo"):
+        return {"success": True, "data": _parse_results(tree)}
+    error_msg = tree.css_first(".error-message")
+    if error_msg:
+        return _search_failed(error_msg.text().strip())
+    if tree.css_first("#cntMain_pnlResults"):
+        return _no_results(query)
+    return None
+
+
+def _load_cookies(jar: httpx.Cookies, cookies: list[dict]):
+    """Copy Playwright cookies into an httpx jar."""
+    for cookie in cookies:
+        jar.set(cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie["path"])
+
+
+def _changed_cookies(jar: httpx.Cookies, cookies: list[dict]) -> list[dict]:
+    """add_cookies() entries for what the jar set or changed since `cookies` was loaded.
+
+    Cookies the browser already had keep their own attributes (secure,
+    httpOnly, expires, sameSite) and only take the jar's new value.
+    """
+    known = {(c["name"], c["domain"], c["path"]): c for c in cookies}
+    changed = []
+    for c in jar.jar:
+        value = c.value or ""
+        cookie = known.get((c.name, c.domain, c.path))
+        if cookie is None:
+            changed.append({
+                "name": c.name,
+                "value": value,
+                "domain": c.domain,
+                "path": c.path or "/",
+                "secure": c.secure,
+                "httpOnly": c.has_nonstandard_attr("HttpOnly"),
+                **({"expires": c.expires} if c.expires else {}),
+            })
+        elif value != cookie["value"]:
+            changed.append({**cookie, "value": value})
+    return changed
+
+
+async def _search_via_http(session: dict, query: str) -> dict | None:
+    """Replay the search postback over HTTP with the session's cookies.
+
+    Returns the same reply as the browser flow, or None when the form tokens
+    can't be refreshed or the postback didn't land back on the search page,
+    in which case the caller falls back to driving the browser.
+    """
+    http, context = session["http"], session["context"]
+    try:
+        # both clients share one login: pick up whatever the browser last received
+        browser_cookies = await context.cookies()
+        _load_cookies(http.cookies, browser_cookies)
+        resp = await http.get(BIZPROFILE_URL)
+        form = _search_form(LexborHTMLParser(resp.text), query)
+        if form is not None:
+            resp = await http.post(BIZPROFILE_URL, data=form)
+            resp.raise_for_status()
+    except Exception as e:
+        logging.warning("HTTP search replay failed, falling back to browser: %s", e)
+        return None
+
+    # hand back anything BizPortal rotated over HTTP; the reply stands either way
+    try:
+        changed = _changed_cookies(http.cookies, browser_cookies)
+        if changed:
+            await context.add_cookies(changed)
+    except Exception as e:
+        logging.warning("Failed to sync cookies back to the browser: %s", e)
+
+    if form is None:
+        return None
+    return _search_reply(LexborHTMLParser(resp.text), query)
+
+
+def _write_gzipped(path: str, text: str):
+    with open(path, "wb") as f:
+        f.write(gzip.compress(text.encode("utf-8")))
+
+
+async def _save_diagnostics(page, name: str):
+    """Dump the page HTML (gzipped) and, outside production, a full-page screenshot.
+
+    Both are captured concurrently and the file write runs off the event loop.
+    """
+    screenshot = f"screenshots/{name}.png"
+    htmlfile   = f"screenshots/{name}.html.gz"
+    captures = [page.content()]
+    if not IS_PRODUCTION:
+        captures.append(page.screenshot(path=screenshot, full_page=True))
+    try:
+        html, *_ = await asyncio.gather(*captures)
+        await asyncio.to_thread(_write_gzipped, htmlfile, html)
+        if IS_PRODUCTION:
+            logging.info("Saved diagnostics to %s", htmlfile)
+        else:
+            logging.info("Saved diagnostics to %s and %s", screenshot, htmlfile)
+    except Exception as dump_err:
+        logging.error("Failed to write diagnostics: %s", dump_err)
+
 
 @app.get("/")
 async def health_check():
@@ -68,98 +704,99 @@ async def test():
 @app.post("/connect")
 async def connect(req: ConnectRequest):
     token = str(uuid.uuid4())
-    pw      = await async_playwright().start()
-
-    # Determine if we're in production based on environment variable
-    is_production = os.getenv("ENVIRONMENT", "development") == "production"
-    
-    browser = await pw.chromium.launch(
-        headless=is_production,  # Headless in production, headed in development
-        args=[
-            '--no-sandbox',
-            '--disable-setuid-sandbox',
-            '--disable-dev-shm-usage',
-            '--disable-gpu'
-        ] if is_production else []
-    )
-    
-    context = await browser.new_context()
-    page    = await context.new_page()
-
-    try:
-        # 1) Go to bizprofile.aspx (redirects you to login.aspx)
-        await page.goto("https://www.bizportal.gov.za/bizprofile.aspx", timeout=30000)
-
-        # 2) Wait for the login panel
-        await page.wait_for_selector("#cntMain_pnlLogin", timeout=30000)
-
-        # 3) Fill & submit
-        await page.fill("input#cntMain_txtIDNo", req.username)
-        await page.fill("input#cntMain_txtPassword", req.password)
-        await page.click("input#cntMain_btnLogin")
-
-        # 4) Brief pause for error banner
-        await asyncio.sleep(2)
-        if err_el := await page.query_selector("#cntMain_lblError"):
-            raise ValueError((await err_el.text_content() or "").strip())
-
-        # 5) Wait for redirect to your profile page
-        await page.wait_for_url("**/user_profile.aspx", timeout=20000)
-        await page.wait_for_selector("#cntMain_gdvCompanyList", timeout=20000)
-
-        # 6) Scrape the enterprises table
-        rows = await page.query_selector_all("#cntMain_gdvCompanyList tbody tr")
-        enterprises = []
-        for row in rows[1:]:  # skip header
-            cells = await row.query_selector_all("td")
-            no   = (await cells[0].text_content() or "").strip()
-            name = (await cells[1].text_content() or "").strip()
-            src_status = await (await cells[2].query_selector("img")).get_attribute("src")
-            src_ar     = await (await cells[3].query_selector("img")).get_attribute("src")
-            enterprises.append({
-                "enterprise_number": no,
-                "enterprise_name":   name,
-                "status":            _map_status_from_src(src_status),
-                "ar_status":         _map_status_from_src(src_ar),
-            })
-
-    except ValueError as ve:
-        # bad credentials or known login error
-        await page.close()
-        await browser.close()
-        await pw.stop()
-        raise HTTPException(401, detail=str(ve))
 
-    except Exception as e:
-        # unexpected error → diagnostics
-        logging.error("Login/navigation error: %s", e)
-        traceback.print_exc()
+    # Everything opened here is torn down on any failure; on success the
+    # stack is handed to the session and unwound by _close_session().
+    async with AsyncExitStack() as stack:
+        pooled = await _acquire_browser()
+        stack.push_async_callback(_release_browser, pooled)
+        context = await _new_context(pooled["browser"])
+        stack.push_async_callback(context.close)
+        page = await context.new_page()
 
-        # dump a screenshot + HTML
-        screenshot = f"screenshots/{token}_connect.png"
-        htmlfile   = f"screenshots/{token}_connect.html"
         try:
-            await page.screenshot(path=screenshot, full_page=True)
-            with open(htmlfile, "w", encoding="utf-8") as f:
-                f.write(await page.content())
-            logging.info("Saved diagnostics to %s and %s", screenshot, htmlfile)
-        except Exception as dump_err:
-            logging.error("Failed to write diagnostics: %s", dump_err)
+            # 1) Go to bizprofile.aspx (redirects you to login.aspx)
+            await page.goto(BIZPROFILE_URL, timeout=30000)
+
+            # 2) Wait for the login panel
+            await page.wait_for_selector("#cntMain_pnlLogin", timeout=30000)
+
+            # 3) Fill & submit
+            await page.fill("input#cntMain_txtIDNo", req.username)
+            await page.fill("input#cntMain_txtPassword", req.password)
+            await page.click("input#cntMain_btnLogin")
+
+            # 4) Race the redirect to your profile page against the error banner
+            profile = asyncio.ensure_future(page.wait_for_url("**/user_profile.aspx", timeout=20000))
+            banner  = asyncio.ensure_future(page.wait_for_selector("#cntMain_lblError", timeout=20000))
+            done, _ = await asyncio.wait({profile, banner}, return_when=asyncio.FIRST_COMPLETED)
+            if banner in done and banner.exception() is None:
+                profile.cancel()
+                raise ValueError((await banner.result().text_content() or "").strip())
+            banner.cancel()
+
+            # 5) Wait for the profile page to render
+            await profile
+            await page.wait_for_selector("#cntMain_gdvCompanyList", timeout=20000)
+
+            # 6) Scrape the enterprises table in one round-trip
+            rows = await page.eval_on_selector_all(
+                "#cntMain_gdvCompanyList tbody tr",
+                """rows => rows.slice(1).map(r => {  // skip header
+                    const c = r.querySelectorAll('td');
+                    const src = cell => cell.querySelector('img')?.src || '';
+                    return {
+                        enterprise_number: c[0].textContent.trim(),
+                        enterprise_name:   c[1].textContent.trim(),
+                        status_src:        src(c[2]),
+                        ar_src:            src(c[3]),
+                    };
+                })"""
+            )
+            enterprises = [{
+                "enterprise_number": row["enterprise_number"],
+                "enterprise_name":   row["enterprise_name"],
+                "status":            _map_status_from_src(row["status_src"]),
+                "ar_status":         _map_status_from_src(row["ar_src"]),
+            } for row in rows]
+
+        except ValueError as ve:
+            # bad credentials or known login error
+            raise HTTPException(401, detail=str(ve))
 
-        await page.close()
-        await browser.close()
-        await pw.stop()
-        raise HTTPException(500, detail=f"Login/navigation error: {e}")
-
-    # success!
-    await page.close()  # close this tab
-    # keep pw & browser & context alive for /search
-    _sessions[token] = {
-        "pw": pw,
-        "browser": browser,
-        "context": context,
-        "created": asyncio.get_event_loop().time()
-    }
+        except Exception as e:
+            # unexpected error → diagnostics
+            logging.exception("Login/navigation error")
+
+            await _save_diagnostics(page, f"{token}_connect")
+            raise HTTPException(500, detail=f"Login/navigation error: {e}")
+
+        # success!
+        # hand the login cookies to a plain HTTP client for the /search fast path
+        cookies = httpx.Cookies()
+        _load_cookies(cookies, await context.cookies())
+        http = httpx.AsyncClient(
+            cookies=cookies,
+            headers={"User-Agent": await page.evaluate("navigator.userAgent")},
+            follow_redirects=True,
+            timeout=30,
+        )
+        stack.push_async_callback(http.aclose)
+
+        await page.close()  # close this tab
+        # keep the context (and its pooled browser) alive for /search;
+        # the session now owns the teardown
+        _sessions[token] = {
+            "pooled": pooled,
+            "context": context,
+            "http": http,
+            "stack": stack.pop_all(),
+            "lock": asyncio.Lock(),
+            "created": time.monotonic()
+        }
+
+    # over capacity → evict the least recently used sessions
+    _evict_lru_sessions()
 
     # **Important**: always return your JSON at the end
     return {
@@ -174,32 +811,69 @@ async def search_company(req: SearchRequest):
     session = _sessions.get(req.session_token)
     if not session:
         raise HTTPException(401, detail="Session expired or invalid")
+    _sessions.move_to_end(req.session_token)
+
+    key = req.query.upper().strip()
+    if (cached := _search_cache.get(key)) is not None:
+        return cached
+
+    # Concurrent misses for the same query share the first one's search;
+    # shielded so one client hanging up doesn't cancel it for the others
+    task = _search_inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_search_and_cache(session, key, req.session_token))
+        _search_inflight[key] = task
+        task.add_done_callback(lambda _: _search_inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _search_and_cache(session: dict, query: str, session_token: str) -> dict:
+    # One extraction at a time per session: they'd share (and race on) its
+    # browser context. Different sessions still run in parallel.
+    async with session["lock"]:
+        result = await _search(session, query, session_token)
+
+    # a miss may just be a freshly registered enterprise, so only cache hits
+    if result.get("success") and result.get("data"):
+        _search_cache[query] = result
+    return result
+
+
+async def _search(session: dict, query: str, session_token: str) -> dict:
+    # Replay the search over plain HTTP first; only drive the browser if that fails
+    result = await _search_via_http(session, query)
+    if result is not None:
+        return result
 
     context = session["context"]
     page = await context.new_page()
     
     try:
         # 1) Navigate to bizprofile.aspx to get fresh tokens
-        await page.goto("https://www.bizportal.gov.za/bizprofile.aspx", timeout=30000)
+        await page.goto(BIZPROFILE_URL, timeout=30000)
         await page.wait_for_selector("#cntMain_pnlSearchBox", timeout=10000)
         
-        # 2) Select "Enterprise No." from dropdown
-        # First, get the current state to detect when AJAX completes
-        await page.select_option("#cntMain_drpSearchOptions", "EntNo")
-        
-        # 3) Wait for AJAX postback to complete
-        # The postback updates the form, so we wait for the input to be ready
-        await asyncio.sleep(1)  # Brief pause for AJAX to start
+        # 2) Select "Enterprise No." from dropdown and 3) wait for its AJAX
+        # postback: the response itself, then the UpdatePanel applying it
         try:
-            await page.wait_for_selector("#cntMain_txtSearchCIPC:not([disabled])", timeout=10000)
+            async with page.expect_response(
+                lambda r: r.request.method == "POST" and "bizprofile.aspx" in r.url,
+                timeout=10000,
+            ):
+                await page.select_option("#cntMain_drpSearchOptions", "EntNo")
+            await page.wait_for_function(
+                "() => !(window.Sys && Sys.WebForms"
+                " && Sys.WebForms.PageRequestManager.getInstance().get_isInAsyncPostBack())",
+                timeout=10000
+            )
         except PlaywrightTimeout:
-            logging.warning("Timeout waiting for search input to be enabled after dropdown change")
+            logging.warning("Timeout waiting for the dropdown postback to complete")
         
         # 4) Fill in the enterprise number
         search_input = await page.query_selector("#cntMain_txtSearchCIPC")
         if search_input:
             await search_input.fill("")  # Clear first
-            await search_input.fill(req.query)
+            await search_input.fill(query)
         else:
             raise ValueError("Could not find search input field")
         
@@ -210,257 +884,23 @@ async def search_company(req: SearchRequest):
         else:
             raise ValueError("Could not find search button")
         
-        # Add a brief wait for the search to process
-        await asyncio.sleep(2)
-        
-        # 6) Wait for results panel to appear
+        # 6) Wait for the results (or an error message) to render
         try:
-            # First check if results are already loaded
-            results_panel = await page.query_selector("#cntMain_pnlResults")
-            if not results_panel:
-                # If not visible, wait for it
-                await page.wait_for_selector("#cntMain_pnlResults", timeout=15000)
-            
-            # Also verify we have the actual data by checking for a key element
-            await page.wait_for_selector("#cntMain_lblEntNo", timeout=5000)
-            
+            await page.wait_for_function(
+                "() => document.getElementById('cntMain_lblEntNo') || document.querySelector('.error-message')",
+                timeout=15000
+            )
         except PlaywrightTimeout:
-            # Check if we got an error message or truly no results
-            error_msg = await page.query_selector(".error-message")  # Adjust selector as needed
-            if error_msg:
-                error_text = (await error_msg.text_content()).strip()
-                await page.close()
-                return {
-                    "success": False,
-                    "error": error_text,
-                    "message": f"Search failed: {error_text}"
-                }
-            
-            # No results found
-            await page.close()
-            return {
-                "success": True,
-                "data": [],
-                "message": f"No results found for enterprise number: {req.query}"
-            }
-        
-        # 7) Extract enterprise details from the results panel
-        
-        # Company Details Tab (already visible)
-        company_details = {}
-        
-        # Extract all company details
-        ent_no = await page.query_selector("#cntMain_lblEntNo")
-        company_details["enterpriseNumber"] = (await ent_no.text_content()).strip() if ent_no else None
-        
-        ent_name = await page.query_selector("#cntMain_lblEntName")
-        company_details["enterpriseName"] = (await ent_name.text_content()).strip() if ent_name else None
-        
-        ent_type = await page.query_selector("#cntMain_lblEntType")
-        company_details["enterpriseType"] = (await ent_type.text_content()).strip() if ent_type else None
-        
-        ent_status = await page.query_selector("#cntMain_lblEntStatus")
-        company_details["enterpriseStatus"] = (await ent_status.text_content()).strip() if ent_status else None
-        
-        compliance = await page.query_selector("#cntMain_lblNonComply")
-        compliance_text = (await compliance.text_content()).strip() if compliance else None
-        company_details["complianceNotice"] = None if compliance_text == "NONE" else compliance_text
-        
-        # Format registration date
-        reg_date_elem = await page.query_selector("#cntMain_lblRegDate")
-        reg_date_raw = (await reg_date_elem.text_content()).strip() if reg_date_elem else None
-        if reg_date_raw and "/" in reg_date_raw:
-            parts = reg_date_raw.split("/")
-            if len(parts) == 3:
-                company_details["registrationDate"] = f"{parts[0]}-{parts[1].zfill(2)}-{parts[2].zfill(2)}"
-            else:
-                company_details["registrationDate"] = reg_date_raw
-        else:
-            company_details["registrationDate"] = reg_date_raw
-        
-        # Format addresses
-        phys_addr_elem = await page.query_selector("#cntMain_lblPhysAddress")
-        phys_addr_raw = (await phys_addr_elem.text_content()).strip() if phys_addr_elem else None
-        company_details["physicalAddress"] = phys_addr_raw.replace("\n", ", ") if phys_addr_raw else None
-        
-        postal_addr_elem = await page.query_selector("#cntMain_lblPostalAddress")
-        postal_addr_raw = (await postal_addr_elem.text_content()).strip() if postal_addr_elem else None
-        company_details["postalAddress"] = postal_addr_raw.replace("\n", ", ") if postal_addr_raw else None
-        
-        # Directors Tab
-        directors = []
-        try:
-            directors_tab = await page.query_selector("label[for='tab-2r']")
-            if directors_tab:
-                await directors_tab.click()
-                await asyncio.sleep(0.5)
-                
-                director_rows = await page.query_selector_all("#cntMain_gdvDirectorDetails tbody tr")
-                for row in director_rows[1:]:  # Skip header
-                    cells = await row.query_selector_all("td")
-                    if len(cells) >= 5:
-                        directors.append({
-                            "idNumber": (await cells[0].text_content()).strip(),
-                            "names": (await cells[1].text_content()).strip(),
-                            "surname": (await cells[2].text_content()).strip(),
-                            "type": (await cells[3].text_content()).strip(),
-                            "status": (await cells[4].text_content()).strip()
-                        })
-        except Exception as e:
-            logging.warning(f"Could not extract director details: {e}")
-        
-        # Annual Returns Tab
-        annual_returns = {"filedAnnualReturns": [], "outstandingAnnualReturns": []}
-        try:
-            ar_tab = await page.query_selector("label[for='tab-3r']")
-            if ar_tab:
-                await ar_tab.click()
-                await asyncio.sleep(0.5)
-                
-                # Filed Annual Returns
-                filed_rows = await page.query_selector_all("#cntMain_gdvARPaid tbody tr")
-                for row in filed_rows[1:]:  # Skip header
-                    cells = await row.query_selector_all("td")
-                    if len(cells) >= 3 and "No annual returns" not in (await cells[0].text_content()):
-                        year_text = (await cells[0].text_content()).strip()
-                        annual_returns["filedAnnualReturns"].append({
-                            "year": int(year_text) if year_text.isdigit() else year_text,
-                            "amountPaid": (await cells[1].text_content()).strip(),
-                            "dateFiled": (await cells[2].text_content()).strip()
-                        })
-                
-                # Outstanding Annual Returns
-                outstanding_rows = await page.query_selector_all("#cntMain_gdvAROutstanding tbody tr")
-                for row in outstanding_rows[1:]:  # Skip header
-                    cells = await row.query_selector_all("td")
-                    if len(cells) >= 3:
-                        year_text = (await cells[0].text_content()).strip()
-                        annual_returns["outstandingAnnualReturns"].append({
-                            "year": int(year_text) if year_text.isdigit() else year_text,
-                            "month": (await cells[1].text_content()).strip(),
-                            "nonComplianceDate": (await cells[2].text_content()).strip()
-                        })
-        except Exception as e:
-            logging.warning(f"Could not extract annual returns: {e}")
-        
-        # Enterprise History Tab
-        history = []
-        try:
-            history_tab = await page.query_selector("label[for='tab-4r']")
-            if history_tab:
-                await history_tab.click()
-                await asyncio.sleep(0.5)
-                
-                history_rows = await page.query_selector_all("#cntMain_gdvEntHist tbody tr")
-                for row in history_rows[1:]:  # Skip header
-                    cells = await row.query_selector_all("td")
-                    if len(cells) >= 2:
-                        date_raw = (await cells[0].text_content()).strip()
-                        # Convert date format from YYYY/MM/DD to YYYY-MM-DD
-                        if "/" in date_raw:
-                            parts = date_raw.split("/")
-                            if len(parts) == 3:
-                                date_formatted = f"{parts[0]}-{parts[1].zfill(2)}-{parts[2].zfill(2)}"
-                            else:
-                                date_formatted = date_raw
-                        else:
-                            date_formatted = date_raw
-                            
-                        history.append({
-                            "date": date_formatted,
-                            "details": (await cells[1].text_content()).strip()
-                        })
-        except Exception as e:
-            logging.warning(f"Could not extract history: {e}")
-        
-        # Information Regulator Compliance Tab
-        compliance_information = {
-            "regulatorRegistrationNumber": None,
-            "organisationType": None,
-            "privateOrganisationType": None,
-            "informationOfficerDetails": {
-                "surname": None,
-                "names": None,
-                "designation": None,
-                "appointmentDate": None
-            },
-            "deputyInformationOfficerDetails": {
-                "surname": None,
-                "names": None,
-                "type": None,
-                "designation": None,
-                "appointmentDate": None
-            },
-            "paiaAnnualReporting": {
-                "submissionHistory": [],
-                "latestSubmissionNote": None
-            }
-        }
-        
-        try:
-            # Check if there's an Information Regulator tab
-            ir_tab = await page.query_selector("label[for='tab-10r']")
-            if ir_tab:
-                await ir_tab.click()
-                await asyncio.sleep(0.5)
-                
-                # Check if the entity is registered
-                not_registered = await page.query_selector("#cntMain_pnlInfoRegNotRegistered")
-                if not not_registered or (await not_registered.get_attribute("style") and "display: none" in await not_registered.get_attribute("style")):
-                    # Entity is registered, extract the data
-                    # Note: The selectors below are hypothetical as they weren't in your HTML
-                    # You'll need to update these based on the actual registered entity HTML structure
-                    
-                    reg_num_element = await page.query_selector("#cntMain_lblIRRegNumber")
-                    if reg_num_element:
-                        compliance_information["regulatorRegistrationNumber"] = (await reg_num_element.text_content()).strip()
-                    
-                    org_type_element = await page.query_selector("#cntMain_lblOrgType")
-                    if org_type_element:
-                        compliance_information["organisationType"] = (await org_type_element.text_content()).strip()
-                    
-                    # Extract other compliance fields if they exist...
-                    # This is a placeholder structure - you'll need the actual selectors
-                    
-        except Exception as e:
-            logging.warning(f"Could not extract compliance information: {e}")
+            pass
         
-        # Other Details Tab
-        other_details = {}
-        try:
-            other_tab = await page.query_selector("label[for='tab-7r']")
-            if other_tab:
-                await other_tab.click()
-                await asyncio.sleep(0.5)
-                
-                tax_element = await page.query_selector("#cntMain_lblTax")
-                other_details["sarsTaxNumber"] = (await tax_element.text_content()).strip() if tax_element else None
-                
-                uif_element = await page.query_selector("#cntMain_lblUIF")
-                uif_text = (await uif_element.text_content()).strip() if uif_element else None
-                other_details["uifRegNumber"] = None if uif_text == "NOT AVAILABLE" else uif_text
-                
-                cf_element = await page.query_selector("#cntMain_lblCF")
-                cf_text = (await cf_element.text_content()).strip() if cf_element else None
-                other_details["compensationFundRegNum"] = None if cf_text == "NOT AVAILABLE" else cf_text
-        except Exception as e:
-            logging.warning(f"Could not extract other details: {e}")
+        # 7) Parse the rendered page locally: results, an error message, or
+        # (the browser having waited this long) no results
+        tree = LexborHTMLParser(await page.content())
         
         # Close the page (keep session alive)
         await page.close()
         
-        # 11) Return the comprehensive data
-        return {
-            "success": True,
-            "data": {
-                "company_details": company_details,
-                "directors": directors,
-                "annual_returns": annual_returns,
-                "history": history,
-                "compliance_information": compliance_information,
-                "other_details": other_details
-            }
-        }
+        return _search_reply(tree, query) or _no_results(query)
         
     except ValueError as ve:
         # Known error (like no view link)
@@ -471,35 +911,16 @@ async def search_company(req: SearchRequest):
         # Timeout error
         logging.error("Timeout during search: %s", pte)
         
-        # Save diagnostics
-        screenshot = f"screenshots/{req.session_token}_search_timeout.png"
-        htmlfile = f"screenshots/{req.session_token}_search_timeout.html"
-        try:
-            await page.screenshot(path=screenshot, full_page=True)
-            with open(htmlfile, "w", encoding="utf-8") as f:
-                f.write(await page.content())
-            logging.info("Saved timeout diagnostics to %s and %s", screenshot, htmlfile)
-        except Exception:
-            pass
+        await _save_diagnostics(page, f"{session_token}_search_timeout")
         
         await page.close()
         raise HTTPException(500, detail="Search operation timed out")
         
     except Exception as e:
         # Unexpected error
-        logging.error("Search error: %s", e)
-        traceback.print_exc()
+        logging.exception("Search error")
         
-        # Save diagnostics
-        screenshot = f"screenshots/{req.session_token}_search_error.png"
-        htmlfile = f"screenshots/{req.session_token}_search_error.html"
-        try:
-            await page.screenshot(path=screenshot, full_page=True)
-            with open(htmlfile, "w", encoding="utf-8") as f:
-                f.write(await page.content())
-            logging.info("Saved error diagnostics to %s and %s", screenshot, htmlfile)
-        except Exception as dump_err:
-            logging.error("Failed to write diagnostics: %s", dump_err)
+        await _save_diagnostics(page, f"{session_token}_search_error")
         
         await page.close()
         raise HTTPException(500, detail=f"Search error: {str(e)}")
@@ -508,15 +929,27 @@ async def search_company(req: SearchRequest):
 # Optional: Add a disconnect endpoint to clean up sessions
 @app.post("/disconnect")
 async def disconnect(session_token: str):
-    session = _sessions.get(session_token)
-    if not session:
+    if session_token not in _sessions:
         return {"success": False, "message": "Session not found"}
     
     try:
-        await session["browser"].close()
-        await session["pw"].stop()
-        del _sessions[session_token]
+        await _close_session(session_token)
         return {"success": True, "message": "Session closed"}
     except Exception as e:
         logging.error("Error closing session: %s", e)
-        return {"success": False, "message": f"Error closing session: {str(e)}"}
\ No newline at end of file
+        return {"success": False, "message": f"Error closing session: {str(e)}"}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # Sessions and the browser pool live in process memory, so extra workers
+    # only help if the load balancer pins each client to one of them.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
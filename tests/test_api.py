@@ -0,0 +1,414 @@
+import asyncio
+import os
+from contextlib import AsyncExitStack
+
+import httpx
+import pytest
+from selectolax.lexbor import LexborHTMLParser
+
+import main
+
+SCREENSHOTS = os.path.join(os.path.dirname(__file__), "..", "screenshots")
+LOGIN_PAGE = os.path.join(SCREENSHOTS, "f68bbe53-4b3a-4c28-84f1-967411b8b3e1_login.html")
+
+# Trimmed bizprofile.aspx results page: every tab is in the markup
+RESULTS_PAGE = """
+<html><body><form>
+<input type="hidden" name="__VIEWSTATE" value="vs" />
+<div id="cntMain_pnlResults">
+  <section class="tab-panel">
+    <span id="cntMain_lblEntNo">K2022464304</span>
+    <span id="cntMain_lblEntName">SKIPPASOFTWARE</span>
+    <span id="cntMain_lblEntType">Private Company</span>
+    <span id="cntMain_lblEntStatus">AR Final deregistration</span>
+    <span id="cntMain_lblNonComply">NONE</span>
+    <span id="cntMain_lblRegDate">2022/5/2</span>
+    <span id="cntMain_lblPhysAddress">1 CAMP STREET
+CAPE TOWN</span>
+    <span id="cntMain_lblPostalAddress"></span>
+  </section>
+  <section class="tab-panel">
+    <table id="cntMain_gdvDirectorDetails"><tbody>
+      <tr><th>ID</th><th>Names</th><th>Surname</th><th>Type</th><th>Status</th></tr>
+      <tr><td>950703 XXXX 08 X</td><td>SIMON LOCKE</td><td>PURDON</td><td>Member</td><td>INACTIVE</td></tr>
+    </tbody></table>
+  </section>
+  <section class="tab-panel">
+    <table id="cntMain_gdvARPaid"><tbody>
+      <tr><th>Year</th><th>Amount</th><th>Date</th></tr>
+      <tr><td>2019</td><td>-100,00</td><td>2019-01-25</td></tr>
+    </tbody></table>
+    <table id="cntMain_gdvAROutstanding"><tbody>
+      <tr><th>Year</th><th>Month</th><th>Date</th></tr>
+      <tr><td>2020</td><td>JANUARY</td><td>2020-03-03</td></tr>
+    </tbody></table>
+  </section>
+  <section class="tab-panel">
+    <table id="cntMain_gdvEntHist"><tbody>
+      <tr><th>Date</th><th>Details</th></tr>
+      <tr><td>2022/05/02</td><td>Registered</td></tr>
+    </tbody></table>
+  </section>
+  <section class="tab-panel">
+    <div id="cntMain_pnlInfoRegNotRegistered" style="display: block">Not registered</div>
+  </section>
+  <section class="tab-panel">
+    <span id="cntMain_lblTax">9123456789</span>
+    <span id="cntMain_lblUIF">NOT AVAILABLE</span>
+    <span id="cntMain_lblCF">CF123</span>
+  </section>
+</div>
+</form></body></html>
+"""
+
+SEARCH_FORM = """
+<form>
+<input type="hidden" name="__VIEWSTATE" value="vs" />
+<input type="hidden" name="__EVENTVALIDATION" value="ev" />
+<div id="cntMain_pnlSearchBox">
+  <select id="cntMain_drpSearchOptions" name="ctl00$cntMain$drpSearchOptions"></select>
+  <input id="cntMain_txtSearchCIPC" name="ctl00$cntMain$txtSearchCIPC" />
+  {button}
+</div>
+</form>
+"""
+
+
+def test_iso_date():
+    assert main._iso_date("2022/5/2") == "2022-05-02"
+    assert main._iso_date("2022/05/02") == "2022-05-02"
+    assert main._iso_date("02 May 2022") == "02 May 2022"
+
+@pytest.mark.parametrize("src, status", [
+    ("https://www.bizportal.gov.za/images/verify_tick_sml.png", "IN BUSINESS"),
+    ("images/verify_orange_sml.png", "IN DEREGISTRATION PROCESS"),
+    ("verify_cross_sml.png?v=2", "FINAL DEREGISTRATION"),
+    ("images/spacer.gif", "UNKNOWN"),
+    ("", "UNKNOWN"),
+])
+def test_map_status_from_src(src, status):
+    assert main._map_status_from_src(src) == status
+
+
+def test_scrape_tree_skips_header_rows():
+    raw = main._scrape_tree(
+        LexborHTMLParser(RESULTS_PAGE),
+        labels=("cntMain_lblEntNo", "cntMain_lblMissing"),
+        tables=("cntMain_gdvEntHist",),
+        styles=("cntMain_pnlInfoRegNotRegistered", "cntMain_pnlMissing"),
+    )
+    assert raw["labels"] == {"cntMain_lblEntNo": "K2022464304", "cntMain_lblMissing": None}
+    assert raw["tables"] == {"cntMain_gdvEntHist": [["2022/05/02", "Registered"]]}
+    assert raw["styles"] == {
+        "cntMain_pnlInfoRegNotRegistered": "display: block",
+        "cntMain_pnlMissing": None,
+    }
+
+
+
+def test_parse_results():
+    data = main._parse_results(LexborHTMLParser(RESULTS_PAGE))
+    assert data["company_details"] == {
+        "enterpriseNumber": "K2022464304",
+        "enterpriseName": "SKIPPASOFTWARE",
+        "enterpriseType": "Private Company",
+        "enterpriseStatus": "AR Final deregistration",
+        "complianceNotice": None,
+        "registrationDate": "2022-05-02",
+        "physicalAddress": "1 CAMP STREET, CAPE TOWN",
+        "postalAddress": None,
+    }
+    assert data["directors"] == [{
+        "idNumber": "950703 XXXX 08 X",
+        "names": "SIMON LOCKE",
+        "surname": "PURDON",
+        "type": "Member",
+        "status": "INACTIVE",
+    }]
+    assert data["annual_returns"] == {
+        "filedAnnualReturns": [{"year": 2019, "amountPaid": "-100,00", "dateFiled": "2019-01-25"}],
+        "outstandingAnnualReturns": [{"year": 2020, "month": "JANUARY", "nonComplianceDate": "2020-03-03"}],
+    }
+    assert data["history"] == [{"date": "2022-05-02", "details": "Registered"}]
+    assert data["compliance_information"] == main._empty_compliance_information()
+    assert data["other_details"] == {
+        "sarsTaxNumber": "9123456789",
+        "uifRegNumber": None,
+        "compensationFundRegNum": "CF123",
+    }
+
+def test_search_reply():
+    reply = main._search_reply(LexborHTMLParser(RESULTS_PAGE), "K2022464304")
+    assert reply["success"]
+    assert reply["data"]["company_details"]["enterpriseNumber"] == "K2022464304"
+
+    no_match = SEARCH_FORM.format(button="") + '<div id="cntMain_pnlResults"></div>'
+    assert main._search_reply(LexborHTMLParser(no_match), "K1") == main._no_results("K1")
+
+    failed = SEARCH_FORM.format(button="") + '<div class="error-message"> Invalid number </div>'
+    assert main._search_reply(LexborHTMLParser(failed), "K1") == main._search_failed("Invalid number")
+
+    # the search box alone means the search never ran: fall back to the browser
+    unsearched = SEARCH_FORM.format(button="")
+    assert main._search_reply(LexborHTMLParser(unsearched), "K1") is None
+
+    with open(LOGIN_PAGE, encoding="utf-8") as f:
+        assert main._search_reply(LexborHTMLParser(f.read()), "K1") is None
+
+
+def test_form_fields_from_login_page():
+    with open(LOGIN_PAGE, encoding="utf-8") as f:
+        tree = LexborHTMLParser(f.read())
+    fields = main._form_fields(tree)
+    assert {"__VIEWSTATE", "__VIEWSTATEGENERATOR", "__EVENTVALIDATION"} <= fields.keys()
+    assert fields["__VIEWSTATE"]
+    assert main._search_form(tree, "K1") is None
+
+
+def test_search_form_with_submit_button():
+    html = SEARCH_FORM.format(
+        button='<input type="submit" id="cntMain_btnSearch" name="ctl00$cntMain$btnSearch" value="Search" />'
+    )
+    form = main._search_form(LexborHTMLParser(html), "K2022464304")
+    assert form == {
+        "__VIEWSTATE": "vs",
+        "__EVENTVALIDATION": "ev",
+        "ctl00$cntMain$drpSearchOptions": "EntNo",
+        "ctl00$cntMain$txtSearchCIPC": "K2022464304",
+        "ctl00$cntMain$btnSearch": "Search",
+    }
+
+
+def test_search_form_with_link_button():
+    html = SEARCH_FORM.format(
+        button="""<a id="cntMain_btnSearch" href="javascript:__doPostBack('ctl00$cntMain$btnSearch','')">Search</a>"""
+    )
+    form = main._search_form(LexborHTMLParser(html), "K2022464304")
+    assert form["__EVENTTARGET"] == "ctl00$cntMain$btnSearch"
+    assert "ctl00$cntMain$btnSearch" not in form
+
+
+def test_changed_cookies_keep_browser_attributes():
+    browser = [
+        {
+            "name": "ASP.NET_SessionId", "value": "old", "domain": "www.bizportal.gov.za",
+            "path": "/", "expires": -1, "httpOnly": True, "secure": True, "sameSite": "Lax",
+        },
+        {
+            "name": "lang", "value": "en", "domain": "www.bizportal.gov.za",
+            "path": "/", "expires": -1, "httpOnly": False, "secure": True, "sameSite": "Lax",
+        },
+    ]
+    jar = httpx.Cookies()
+    main._load_cookies(jar, browser)
+    jar.extract_cookies(httpx.Response(
+        200,
+        headers=[
+            ("set-cookie", "ASP.NET_SessionId=new; path=/; HttpOnly"),
+            ("set-cookie", "extra=1; path=/; secure; HttpOnly"),
+        ],
+        request=httpx.Request("GET", main.BIZPROFILE_URL),
+    ))
+    changed = main._changed_cookies(jar, browser)
+    assert {**browser[0], "value": "new"} in changed
+    assert all(c["name"] != "lang" for c in changed)
+    extra = next(c for c in changed if c["name"] == "extra")
+    assert extra["domain"] == "www.bizportal.gov.za"
+    assert extra["secure"] and extra["httpOnly"]
+
+
+class FakeContext:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeHTTP:
+    def __init__(self):
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+def _fake_session(created=0.0):
+    session = {"context": FakeContext(), "http": FakeHTTP(), "pooled": {"browser": None},
+               "lock": asyncio.Lock(), "created": created}
+    stack = AsyncExitStack()
+    stack.push_async_callback(main._release_browser, session["pooled"])
+    stack.push_async_callback(session["context"].close)
+    stack.push_async_callback(session["http"].aclose)
+    session["stack"] = stack
+    return session
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    released = []
+
+    async def release(pooled):
+        released.append(pooled)
+
+    monkeypatch.setattr(main, "_sessions", main.OrderedDict())
+    monkeypatch.setattr(main, "_release_browser", release)
+    return released
+
+
+@pytest.mark.asyncio
+async def test_close_session_releases_browser(sessions):
+    session = _fake_session()
+    main._sessions["a"] = session
+    await main._close_session("a")
+    await main._close_session("a")  # already gone → no-op
+    assert "a" not in main._sessions
+    assert session["context"].closed and session["http"].closed
+    assert sessions == [session["pooled"]]
+
+
+@pytest.mark.asyncio
+async def test_evict_lru_sessions(sessions, monkeypatch):
+    monkeypatch.setattr(main, "MAX_SESSIONS", 2)
+    for token in "abc":
+        main._sessions[token] = _fake_session()
+    main._sessions.move_to_end("a")  # "b" is now least recently used
+    evicted = main._sessions["b"]
+    main._evict_lru_sessions()
+    assert list(main._sessions) == ["c", "a"]
+    await asyncio.gather(*main._evictions)
+    assert evicted["context"].closed
+    assert sessions == [evicted["pooled"]]
+
+
+@pytest.mark.asyncio
+async def test_close_stale_sessions(sessions, monkeypatch):
+    monkeypatch.setattr(main.time, "monotonic", lambda: 1000.0)
+    main._sessions["old"] = _fake_session(created=1000.0 - main.SESSION_TTL - 1)
+    main._sessions["new"] = _fake_session(created=1000.0)
+    await main._close_stale_sessions()
+    assert list(main._sessions) == ["new"]
+    assert len(sessions) == 1
+
+
+class FakeSearch:
+    """Stands in for main._search, holding every search until released."""
+
+    def __init__(self):
+        self.queries = []
+        self.released = asyncio.Event()
+
+    async def __call__(self, session, query, session_token):
+        self.queries.append(query)
+        await self.released.wait()
+        if query == "K1":
+            return main._no_results(query)
+        return {"success": True, "data": {"company_details": {"enterpriseNumber": query}}}
+
+
+@pytest.fixture
+def searches(sessions, monkeypatch):
+    monkeypatch.setattr(main, "_search_cache", main.TTLCache(maxsize=10, ttl=60))
+    monkeypatch.setattr(main, "_search_inflight", {})
+    main._sessions["a"] = _fake_session()
+    search = FakeSearch()
+    monkeypatch.setattr(main, "_search", search)
+    return search
+
+
+@pytest.mark.asyncio
+async def test_search_coalesces_concurrent_misses(searches):
+    requests = [
+        main.SearchRequest(session_token="a", query=q)
+        for q in ("k2022464304", " K2022464304 ", "K2022464304")
+    ]
+    pending = [asyncio.create_task(main.search_company(r)) for r in requests]
+    await asyncio.sleep(0)
+    searches.released.set()
+    replies = await asyncio.gather(*pending)
+    assert searches.queries == ["K2022464304"]
+    assert all(reply is replies[0] for reply in replies)
+    assert not main._search_inflight
+
+    # served from the cache from now on
+    assert await main.search_company(requests[0]) is replies[0]
+    assert searches.queries == ["K2022464304"]
+
+
+@pytest.mark.asyncio
+async def test_search_caches_only_results(searches):
+    searches.released.set()
+    req = main.SearchRequest(session_token="a", query="k1")
+    assert await main.search_company(req) == main._no_results("K1")
+    await main.search_company(req)
+    assert searches.queries == ["K1", "K1"]
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.contexts = []
+
+    def is_connected(self):
+        return self.connected
+
+    async def close(self):
+        self.connected = False
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """An empty shared-browser pool whose launches hand out FakeBrowsers."""
+    async def launch():
+        return {"browser": FakeBrowser(), "uses": 0, "active": 0, "launched": main.time.monotonic()}
+
+    monkeypatch.setattr(main, "_pw", object())
+    monkeypatch.setattr(main, "_browsers", [])
+    monkeypatch.setattr(main, "_sessions", main.OrderedDict())
+    monkeypatch.setattr(main, "_launch_browser", launch)
+    monkeypatch.setattr(main, "BROWSER_POOL_SIZE", 2)
+    return main._browsers
+
+
+@pytest.mark.asyncio
+async def test_acquire_browser_spreads_sessions(pool):
+    first = await main._acquire_browser()
+    second = await main._acquire_browser()
+    third = await main._acquire_browser()
+    assert len(pool) == 2
+    assert first is not second
+    assert third is first
+    assert (first["active"], first["uses"]) == (2, 2)
+
+
+@pytest.mark.asyncio
+async def test_release_browser_retires_worn_out_browser(pool, monkeypatch):
+    monkeypatch.setattr(main, "BROWSER_MAX_USES", 2)
+    pooled = await main._acquire_browser()
+    await main._acquire_browser()
+    again = await main._acquire_browser()
+    assert again is pooled and pooled["uses"] == 2
+
+    await main._release_browser(pooled)
+    assert pooled in pool  # still serving a session
+    await main._release_browser(pooled)
+    assert pooled not in pool
+    assert not pooled["browser"].is_connected()
+
+
+@pytest.mark.asyncio
+async def test_check_browsers_drops_sessions_of_crashed_browser(pool):
+    crashed = await main._acquire_browser()
+    healthy = await main._acquire_browser()
+    for token, pooled in (("a", crashed), ("b", healthy)):
+        session = _fake_session()
+        session["pooled"] = pooled
+        session["stack"] = AsyncExitStack()
+        session["stack"].push_async_callback(main._release_browser, pooled)
+        main._sessions[token] = session
+    crashed["browser"].connected = False
+
+    await main._check_browsers()
+    assert list(main._sessions) == ["b"]
+    assert crashed not in pool
+    assert healthy in pool and len(pool) == 2  # topped back up